@@ -11,6 +11,7 @@ import streamlit.components.v1 as components
 
 from pyvis.network import Network
 
+@st.cache_data(max_entries=128, show_spinner=False)
 def build_graph_html(graph_data: Dict) -> str:
     net = Network(height="600px", width="100%", bgcolor="#ffffff", directed=True)
 
@@ -62,7 +63,8 @@ with st.sidebar:
         st.info("Stats unavailable")
 
 # Main query input
-user_query = st.text_input("Ask about medical research:", "")
+# Stripped so a whitespace-only query counts as empty everywhere below
+user_query = st.text_input("Ask about medical research:", "").strip()
 
 # Placeholder for chatbot response (your group can wire real RAG here)
 if st.button("Ask Chatbot"):
@@ -73,6 +75,9 @@ if st.button("Ask Chatbot"):
 
 st.markdown("---")
 
+# One search per rerun, shared by the graph and the email panel
+top_papers = get_top_papers(user_query, k=5) if user_query else []
+
 col1, col2 = st.columns(2)
 
 with col1:
@@ -81,7 +86,7 @@ with col1:
         if not user_query:
             st.warning("Enter a query first.")
         else:
-            graph_data = get_knowledge_graph(user_query)
+            graph_data = get_knowledge_graph(top_papers)
             html = build_graph_html(graph_data)
             components.html(html, height=600, scrolling=True)
 
@@ -91,7 +96,7 @@ with col2:
         if not user_query:
             st.warning("Enter a query first.")
         else:
-            papers = get_top_papers(user_query, k=5)
+            papers = top_papers
             if not papers:
                 st.warning("No papers found for this query.")
             else:
@@ -1,38 +1,43 @@
 # backend.py
 
 from typing import List, Dict
+import streamlit as st
 from database_manager import DatabaseManager
 
-db = DatabaseManager()
+@st.cache_resource
+def get_db() -> DatabaseManager:
+    """One DatabaseManager per server process, shared across sessions and reruns."""
+    return DatabaseManager()
+
+# Module-level handle: kept out of the st.cache_data keys below since the
+# sqlite connection can't be hashed or pickled.
+db = get_db()
 
 def get_top_papers(query: str, k: int = 5) -> List[Dict]:
     """
     Simple wrapper: returns top-k papers for a query.
-    For now this just does a LIKE search over title/abstract.
+    Non-empty queries go through the FTS5 (BM25) index on title/abstract.
     """
+    # FTS matching is case-insensitive, so fold case/whitespace before the
+    # cache lookup and let "LLM  agents" and "llm agents" share one entry
+    return _top_papers(" ".join(query.lower().split()), k)
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def _top_papers(query: str, k: int) -> List[Dict]:
     # If query empty, just grab any k recent papers
     if not query:
-        rows = db.cursor.execute(
-            """
-            SELECT arxiv_id, title, abstract, authors, published_date
-            FROM papers
-            WHERE processed = 1
-            ORDER BY fetched_date DESC
-            LIMIT ?
-            """,
-            (k,),
-        ).fetchall()
-        return [dict(r) for r in rows]
+        return db.get_recent_papers(limit=k)
 
     rows = db.search_papers(query=query, limit=k)
     return rows
 
-def get_knowledge_graph(query: str) -> Dict:
+def get_knowledge_graph(papers: List[Dict]) -> Dict:
     """
     Stub for graph data. Replace with real Neo4j call later.
-    For now, return a tiny fake graph built from top-3 papers.
+    For now, return a tiny fake graph built from the top-3 of the given papers
+    (callers pass the list they already got from get_top_papers).
     """
-    papers = get_top_papers(query, k=3)
+    papers = papers[:3]
     nodes = []
     edges = []
 
@@ -60,6 +65,7 @@ def get_knowledge_graph(query: str) -> Dict:
 
     return {"nodes": nodes, "edges": edges}
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_db_stats() -> Dict:
     """Expose DB stats for optional UI display."""
     return db.get_stats()
@@ -1,11 +1,28 @@
 import sqlite3
+import contextlib
 import json
-from typing import List, Dict, Optional
+import re
+import threading
+from typing import Iterator, List, Dict, Optional
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# First author pulled out of the JSON authors column by SQLite's JSON1, so
+# list views can show it without json.loads in Python
+FIRST_AUTHOR_SQL = "CASE WHEN json_valid({col}) THEN json_extract({col}, '$[0]') END"
+
+
+def parse_json_list(value) -> List:
+    """Decode a JSON array column, tolerating NULL and malformed values."""
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return []
+
 
 class DatabaseManager:
     """Core database manager for all RAG bot data"""
@@ -16,12 +33,63 @@ class DatabaseManager:
         import os
         os.makedirs("./data", exist_ok=True)
 
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+        # One connection per thread: Streamlit runs each session in its own thread
+        self._local = threading.local()
+        # Every connection handed out, keyed by owning thread, so close() can reach them all
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
         self._create_tables()
         logger.info(f"Database initialized at {db_path}")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection owned by the calling thread, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only the owning thread uses it; check_same_thread=False just lets
+            # close() shut it from another thread
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._configure_connection(conn)
+            with self._connections_lock:
+                self._close_finished_threads()
+                self._connections[threading.current_thread()] = conn
+            self._local.conn = conn
+        return conn
+
+    def _close_finished_threads(self):
+        """Close connections whose thread has exited (caller holds the lock)."""
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            self._connections.pop(thread).close()
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Cursor on the calling thread's connection."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        return cursor
     
+    def _tuple_cursor(self) -> sqlite3.Cursor:
+        """Fresh cursor yielding plain tuples, for hot reads unpacked positionally."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    @staticmethod
+    def _configure_connection(conn: sqlite3.Connection):
+        """Apply per-connection PRAGMAs (WAL for concurrent readers, bigger cache, mmap)."""
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = -65536")  # 64 MiB
+        conn.execute("PRAGMA mmap_size = 268435456")  # 256 MiB
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA busy_timeout = 5000")  # wait on a concurrent writer instead of failing
+        conn.execute("PRAGMA foreign_keys = ON")
+        # INSERT OR REPLACE only fires the papers_fts delete trigger when
+        # recursive triggers are on; without it the FTS index keeps stale rows.
+        conn.execute("PRAGMA recursive_triggers = ON")
+
     def _create_tables(self):
         """Create all necessary tables"""
         
@@ -44,6 +112,62 @@ class DatabaseManager:
             fetched_date DATETIME DEFAULT CURRENT_TIMESTAMP
         )
         """)
+
+        # No query orders by published_date alone; drop the index earlier builds created
+        self.cursor.execute("DROP INDEX IF EXISTS idx_papers_pubdate")
+        # Partial indexes matching the get_papers_for_summarization / _for_digest filters
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_papers_summ ON papers(fetched_date)
+        WHERE pdf_downloaded = 1 AND summary_generated = 0
+        """)
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_papers_digest ON papers(published_date)
+        WHERE processed = 1 AND summary_generated = 1
+        """)
+
+        # Full-text index over papers (external content, kept in sync by triggers).
+        # It is keyed on papers' implicit rowid, which a plain VACUUM may
+        # renumber; compact the database with vacuum() below, which rebuilds
+        # the index afterwards, or run INSERT INTO papers_fts(papers_fts)
+        # VALUES('rebuild') after any manual VACUUM.
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'papers_fts'"
+        )
+        fts_exists = self.cursor.fetchone() is not None
+        self.cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+            arxiv_id UNINDEXED,
+            title,
+            abstract,
+            content='papers',
+            content_rowid='rowid',
+            tokenize='porter unicode61'
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS papers_fts_ai AFTER INSERT ON papers BEGIN
+            INSERT INTO papers_fts(rowid, arxiv_id, title, abstract)
+            VALUES (new.rowid, new.arxiv_id, new.title, new.abstract);
+        END
+        """)
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS papers_fts_ad AFTER DELETE ON papers BEGIN
+            INSERT INTO papers_fts(papers_fts, rowid, arxiv_id, title, abstract)
+            VALUES ('delete', old.rowid, old.arxiv_id, old.title, old.abstract);
+        END
+        """)
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS papers_fts_au
+        AFTER UPDATE OF arxiv_id, title, abstract ON papers BEGIN
+            INSERT INTO papers_fts(papers_fts, rowid, arxiv_id, title, abstract)
+            VALUES ('delete', old.rowid, old.arxiv_id, old.title, old.abstract);
+            INSERT INTO papers_fts(rowid, arxiv_id, title, abstract)
+            VALUES (new.rowid, new.arxiv_id, new.title, new.abstract);
+        END
+        """)
+        if not fts_exists:
+            # One-time backfill for databases created before the FTS index existed
+            self.cursor.execute("INSERT INTO papers_fts(papers_fts) VALUES('rebuild')")
         
         # Embeddings table
         self.cursor.execute("""
@@ -85,35 +209,52 @@ class DatabaseManager:
 
     # --- Paper-Related Methods ---
 
+    _INSERT_PAPER_SQL = """
+        INSERT OR REPLACE INTO papers (
+            arxiv_id, title, abstract, authors, published_date,
+            categories, pdf_url
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+
+    @staticmethod
+    def _paper_params(paper_data: Dict) -> tuple:
+        """Bind parameters for _INSERT_PAPER_SQL."""
+        return (
+            paper_data["arxiv_id"],
+            paper_data["title"],
+            paper_data.get("abstract"),
+            json.dumps(paper_data.get("authors", [])),
+            paper_data.get("published_date"),
+            json.dumps(paper_data.get("categories", [])),
+            paper_data.get("pdf_url"),
+        )
+
     def insert_paper(self, paper_data: Dict) -> bool:
         """Insert or update a paper."""
         try:
-            authors = json.dumps(paper_data.get("authors", []))
-            categories = json.dumps(paper_data.get("categories", []))
-            self.cursor.execute(
-                """
-                INSERT OR REPLACE INTO papers (
-                    arxiv_id, title, abstract, authors, published_date,
-                    categories, pdf_url
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    paper_data["arxiv_id"],
-                    paper_data["title"],
-                    paper_data.get("abstract"),
-                    authors,
-                    paper_data.get("published_date"),
-                    categories,
-                    paper_data.get("pdf_url"),
-                ),
-            )
+            self.cursor.execute(self._INSERT_PAPER_SQL, self._paper_params(paper_data))
             self.conn.commit()
             return True
         except Exception as e:
             logger.error(f"Error inserting paper: {e}")
             self.conn.rollback()
             return False
+
+    def insert_papers(self, papers: List[Dict]) -> bool:
+        """Insert or update many papers in a single transaction."""
+        try:
+            with self.conn:
+                self.cursor.executemany(
+                    self._INSERT_PAPER_SQL,
+                    [self._paper_params(p) for p in papers],
+                )
+            # Refresh planner statistics now the table has grown
+            self.conn.execute("PRAGMA optimize")
+            return True
+        except Exception as e:
+            logger.error(f"Error inserting papers: {e}")
+            return False
     
     def get_paper(self, arxiv_id: str) -> Optional[Dict]:
         """Fetch a single paper by its ID."""
@@ -131,91 +272,181 @@ class DatabaseManager:
             paper["sections"] = {}
         return paper
 
-    def get_papers_for_summarization(self) -> List[Dict]:
-        """Fetch papers that have full text but lack a summary."""
-        self.cursor.execute("""
+    def iter_papers_for_summarization(self) -> Iterator[Dict]:
+        """Stream papers that have full text but lack a summary."""
+        # Own cursor, so interleaved calls on self.cursor can't cut the stream short
+        for row in self.conn.execute("""
         SELECT * FROM papers 
         WHERE pdf_downloaded = 1 AND full_text IS NOT NULL AND summary_generated = 0
         LIMIT 5
-        """)
-        return [dict(row) for row in self.cursor.fetchall()]
+        """):
+            yield dict(row)
 
-    def get_papers_for_digest(self, start_date: str, end_date: str) -> List[Dict]:
-        """Fetch processed papers within a date range."""
-        self.cursor.execute("""
+    def get_papers_for_summarization(self) -> List[Dict]:
+        """Fetch papers that have full text but lack a summary."""
+        return list(self.iter_papers_for_summarization())
+
+    def iter_papers_for_digest(self, start_date: str, end_date: str) -> Iterator[Dict]:
+        """Stream processed papers within a date range without buffering them all."""
+        for row in self.conn.execute("""
         SELECT * FROM papers
         WHERE published_date BETWEEN ? AND ?
           AND processed = 1
           AND summary_generated = 1
-        """, (start_date, end_date))
-        return [dict(row) for row in self.cursor.fetchall()]
+        """, (start_date, end_date)):
+            yield dict(row)
 
-    def search_papers(self, query: str, limit: int = 10) -> List[Dict]:
-        """Simple text search in papers."""
-        like = f"%{query}%"
-        self.cursor.execute("""
-        SELECT arxiv_id, title, abstract, authors, published_date
+    def get_papers_for_digest(self, start_date: str, end_date: str) -> List[Dict]:
+        """Fetch processed papers within a date range."""
+        return list(self.iter_papers_for_digest(start_date, end_date))
+
+    def get_recent_papers(self, limit: int = 10) -> List[Dict]:
+        """Most recently fetched processed papers."""
+        self.cursor.execute(f"""
+        SELECT arxiv_id, title, abstract, authors, published_date,
+               {FIRST_AUTHOR_SQL.format(col="authors")} AS first_author
         FROM papers
-        WHERE (title LIKE ? OR abstract LIKE ?)
-        ORDER BY published_date DESC
+        WHERE processed = 1
+        ORDER BY fetched_date DESC
         LIMIT ?
-        """, (like, like, limit))
-        rows = self.cursor.fetchall()
-        results = []
-        for r in rows:
-            d = dict(r)
-            try:
-                d["authors"] = json.loads(d["authors"]) if d.get("authors") else []
-            except json.JSONDecodeError:
-                d["authors"] = []
-            results.append(d)
-        return results
+        """, (limit,))
+        return [dict(r) for r in self.cursor.fetchall()]
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """
+        Turn free text into an FTS5 expression: quoted terms joined by spaces
+        (implicit AND). Only terms of 3+ characters become prefix searches, so
+        fragments like the "s" in "Crohn's" don't match every s-word.
+        """
+        tokens = re.findall(r"\w+", query)
+        return " ".join(f'"{t}"*' if len(t) >= 3 else f'"{t}"' for t in tokens)
+
+    def search_papers(self, query: str, limit: int = 10, decode_json: bool = False) -> List[Dict]:
+        """
+        BM25-ranked full-text search over paper titles and abstracts.
+        `authors` is returned as the raw JSON string unless decode_json is set;
+        `first_author` is the first author as a plain string, or None when the
+        authors array is empty or invalid.
+        """
+        fts_query = self._fts_query(query)
+        if not fts_query:
+            return []
+        cursor = self._tuple_cursor()
+        cursor.execute(f"""
+        SELECT p.arxiv_id, p.title, p.abstract, p.authors, p.published_date,
+               {FIRST_AUTHOR_SQL.format(col="p.authors")}
+        FROM papers_fts f
+        JOIN papers p ON p.rowid = f.rowid
+        WHERE papers_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+        """, (fts_query, limit))
+        return [
+            {
+                "arxiv_id": arxiv_id,
+                "title": title,
+                "abstract": abstract,
+                "authors": parse_json_list(authors) if decode_json else authors,
+                "published_date": published_date,
+                "first_author": first_author,
+            }
+            for arxiv_id, title, abstract, authors, published_date, first_author in cursor
+        ]
 
     def get_stats(self) -> Dict:
         """Fetch basic pipeline statistics."""
-        self.cursor.execute("SELECT COUNT(arxiv_id) FROM papers")
-        total_papers = self.cursor.fetchone()[0]
-        self.cursor.execute("SELECT COUNT(arxiv_id) FROM papers WHERE processed = 1")
-        processed_papers = self.cursor.fetchone()[0]
-        self.cursor.execute("SELECT COUNT(arxiv_id) FROM papers WHERE embedding_created = 1")
-        papers_with_embeddings = self.cursor.fetchone()[0]
-        
+        self.cursor.execute("""
+        SELECT COUNT(*),
+               COALESCE(SUM(processed), 0),
+               COALESCE(SUM(embedding_created), 0)
+        FROM papers
+        """)
+        total_papers, processed_papers, papers_with_embeddings = self.cursor.fetchone()
+
         return {
             "total_papers": total_papers,
             "processed_papers": processed_papers,
             "papers_with_embeddings": papers_with_embeddings,
         }
-        
+
+    # --- Embedding Methods ---
+
+    def store_embeddings_batch(self, rows: List[tuple]) -> bool:
+        """
+        Store many chunk embeddings in a single transaction.
+        rows: (arxiv_id, chunk_index, chunk_text, embedding_blob, chunk_type) tuples.
+        """
+        try:
+            with self.conn:
+                self.cursor.executemany(
+                    """
+                    INSERT INTO embeddings (arxiv_id, chunk_index, chunk_text, embedding, chunk_type)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error storing embeddings: {e}")
+            return False
+
     # --- User Management Methods ---
 
-    def add_or_update_user(self, email: str, preferences: List[str]):
-        """Add a new user or update an existing user's preferences."""
-        pref_json = json.dumps(preferences)
-        self.cursor.execute("""
+    _UPSERT_USER_SQL = """
         INSERT INTO users (email, preferences, is_active) 
         VALUES (?, ?, 1)
         ON CONFLICT(email) DO UPDATE SET 
             preferences = excluded.preferences, 
             is_active = excluded.is_active
-        """, (email, pref_json))
+        """
+
+    def add_or_update_user(self, email: str, preferences: List[str]):
+        """Add a new user or update an existing user's preferences."""
+        pref_json = json.dumps(preferences)
+        self.cursor.execute(self._UPSERT_USER_SQL, (email, pref_json))
         self.conn.commit()
         logger.info(f"User preferences updated for: {email}")
 
+    def add_or_update_users(self, users: Dict[str, List[str]]):
+        """Upsert many users ({email: preferences}) in a single transaction."""
+        with self.conn:
+            self.cursor.executemany(
+                self._UPSERT_USER_SQL,
+                [(email, json.dumps(prefs)) for email, prefs in users.items()],
+            )
+        logger.info(f"User preferences updated for {len(users)} users")
+
     def get_all_subscribers(self) -> List[Dict]:
         """Retrieve all active subscribers with their preferences."""
-        self.cursor.execute("SELECT email, preferences FROM users WHERE is_active = 1")
-        subscribers = []
-        for row in self.cursor.fetchall():
-            try:
-                preferences = json.loads(row["preferences"]) if row["preferences"] else []
-            except json.JSONDecodeError:
-                preferences = []
-            subscribers.append({"email": row["email"], "preferences": preferences})
-        return subscribers
+        cursor = self._tuple_cursor()
+        cursor.execute("SELECT email, preferences FROM users WHERE is_active = 1")
+        return [
+            {"email": email, "preferences": parse_json_list(preferences)}
+            for email, preferences in cursor
+        ]
     
+    def vacuum(self):
+        """VACUUM the database, then rebuild papers_fts against the possibly renumbered rowids."""
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        with self.conn:
+            self.conn.execute("INSERT INTO papers_fts(papers_fts) VALUES('rebuild')")
+
     def close(self):
-        """Close database connection."""
-        self.conn.close()
+        """Close every thread's database connection; later use reopens lazily."""
+        own = getattr(self._local, "conn", None)
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            self._local = threading.local()
+        # Planner stats are database-wide, so re-analyzing drifted tables on our
+        # own connection is enough; other threads' connections are only closed
+        if own is not None:
+            with contextlib.suppress(sqlite3.Error):
+                own.execute("PRAGMA optimize")
+        for conn in connections:
+            conn.close()
 
 
 if __name__ == "__main__":
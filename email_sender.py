@@ -2,72 +2,244 @@
 Script to send personalized weekly RAG research digests to all active subscribers.
 This script should be scheduled to run weekly (e.g., via the orchestrator).
 """
+import os
+import queue
 import smtplib
+import threading
+from collections import deque
+from contextlib import contextmanager
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import logging
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from typing import Dict, List
 
-# Import necessary local components
+# Import necessary local components (digest_generator is imported lazily in
+# generate_and_send_digests so the SMTP helpers load without the digest stack)
 try:
     from database_manager import DatabaseManager
-    from digest_generator import EmailDigestBot
 except ImportError as e:
     print(f"Error importing components: {e}")
-    print("Make sure database_manager.py and digest_generator.py are in the same directory.")
+    print("Make sure database_manager.py is in the same directory.")
     import sys
     sys.exit(1)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- Email Configuration (PLACEHOLDERS) ---
-SMTP_SERVER = 'smtp.gmail.com' # Change this for other providers (e.g., smtp.sendgrid.net)
-SMTP_PORT = 587 # Standard TLS port
-SENDER_EMAIL = 'YOUR_SENDER_EMAIL@gmail.com' # Replace with your email
-SMTP_PASSWORD = 'YOUR_APP_PASSWORD' # Replace with your app-specific password (not primary password)
+# --- Email Configuration (read once from the environment; placeholders mean mock mode) ---
+SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com') # e.g. smtp.sendgrid.net for other providers
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587')) # Standard TLS port
+SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'YOUR_SENDER_EMAIL@gmail.com')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', 'YOUR_APP_PASSWORD') # App-specific password, not the primary one
 
-def send_digest_email(recipient_email: str, subject: str, html_content: str):
+# Mock mode while placeholder credentials are in place; MOCK_SMTP_DELAY (seconds)
+# optionally simulates network latency per mocked send
+IS_MOCK = SENDER_EMAIL == 'YOUR_SENDER_EMAIL@gmail.com' or SMTP_PASSWORD in ('YOUR_APP_PASSWORD', '')
+MOCK_SMTP_DELAY = float(os.environ.get('MOCK_SMTP_DELAY', '0'))
+
+DELIVERY_WORKERS = 4 # Threads rendering and sending digests, each with its own SMTP connection
+MAX_EMAILS_PER_MINUTE = 60 # Provider send cap (Gmail throttles bursts), shared by all workers
+
+class RateLimiter:
+    """Sliding-window limiter allowing at most max_calls per period seconds across threads."""
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until another call fits in the window, then records it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                delay = self.period - (now - self._calls[0])
+            time.sleep(delay)
+
+def open_smtp_connection():
+    """
+    Opens an authenticated SMTP connection, or returns None when the
+    placeholder credentials are still in place (mock mode).
+    """
+    if IS_MOCK:
+        return None
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    server.starttls()  # Start TLS encryption
+    server.login(SENDER_EMAIL, SMTP_PASSWORD)
+    return server
+
+# Pool slot whose connection dropped; the next acquire() reopens it. Distinct
+# from None, which is a mock-mode connection.
+_RECONNECT = object()
+
+def _close_smtp_connection(server):
+    if server is None or server is _RECONNECT:
+        return
+    try:
+        server.quit()
+    except smtplib.SMTPException:
+        server.close()
+
+class SMTPPool:
+    """
+    Fixed set of logged-in SMTP connections lent to worker threads, so TLS +
+    login happen once per pooled connection instead of once per email.
+    In mock mode every slot holds None.
+    """
+
+    def __init__(self, size: int):
+        self._connections = queue.Queue()
+        try:
+            for _ in range(size):
+                self._connections.put(open_smtp_connection())
+        except Exception:
+            self.close()
+            raise
+
+    @contextmanager
+    def acquire(self):
+        """Borrows a connection; a dropped one goes back to be reopened on next use."""
+        server = self._connections.get()
+        if server is _RECONNECT:
+            try:
+                server = open_smtp_connection()
+            except Exception:
+                self._connections.put(_RECONNECT)
+                raise
+        try:
+            yield server
+        except smtplib.SMTPServerDisconnected:
+            _close_smtp_connection(server)
+            server = _RECONNECT
+            raise
+        finally:
+            self._connections.put(server)
+
+    def close(self):
+        while not self._connections.empty():
+            _close_smtp_connection(self._connections.get_nowait())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def build_message(recipient_email: str, subject: str, html_part: MIMEText) -> MIMEMultipart:
+    """
+    Wraps an already-encoded HTML part in a per-recipient message. The part is
+    shared by every subscriber with the same digest, so only the headers are
+    built per send.
+    """
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = recipient_email
+    msg.attach(html_part)
+    return msg
+
+def send_digest_email(server, recipient_email: str, subject: str, html_part: MIMEText):
     """
-    Mocks sending the email using SMTP. 
-    In a live environment, this is where the actual SMTP connection happens.
+    Sends one digest over an already-open SMTP connection (see SMTPPool).
+    If server is None the send is mocked. SMTPServerDisconnected is re-raised
+    so the caller can reconnect and retry.
     """
-    if SENDER_EMAIL == 'YOUR_SENDER_EMAIL@gmail.com' or SMTP_PASSWORD == 'YOUR_APP_PASSWORD':
+    if server is None:
         logger.warning(f"Mocking email send to {recipient_email}. Please update SMTP credentials for live sending.")
         # Simulating a successful send
-        time.sleep(0.5) 
+        if MOCK_SMTP_DELAY:
+            time.sleep(MOCK_SMTP_DELAY)
         return True
 
     try:
-        # Create message container
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = recipient_email
-
-        # Attach HTML content
-        part1 = MIMEText(html_content, 'html')
-        msg.attach(part1)
-
-        # Connect to SMTP server
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()  # Start TLS encryption
-            server.login(SENDER_EMAIL, SMTP_PASSWORD)
-            server.send_message(msg)
+        msg = build_message(recipient_email, subject, html_part)
+        # Serialize straight to bytes (no intermediate str as with as_string())
+        server.sendmail(SENDER_EMAIL, [recipient_email], msg.as_bytes())
         
         logger.info(f"Successfully sent digest to {recipient_email}")
         return True
 
+    except smtplib.SMTPServerDisconnected:
+        raise
     except Exception as e:
         logger.error(f"Failed to send email to {recipient_email}: {e}")
         return False
 
+class DigestCache:
+    """
+    Renders (and MIME-encodes) each distinct preference list once per run.
+    Subscribers with the same preferences get the same digest part, and worker
+    threads asking for a key that is already rendering wait for that result
+    instead of redoing it.
+    """
+
+    def __init__(self, digest_bot):
+        self.digest_bot = digest_bot
+        self._entries: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, preferences: List[str]) -> MIMEText:
+        key = tuple(preferences)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = Future()
+        if owner:
+            try:
+                html_content = self.digest_bot.generate_digest_html(preferences)
+                entry.set_result(MIMEText(html_content, 'html'))
+            except Exception as e:
+                entry.set_exception(e)
+        return entry.result()
+
+def render_digest(digests: DigestCache, subscriber: Dict):
+    """Builds the (subject, html part) pair for one subscriber."""
+    preferences = subscriber['preferences']
+    logger.info(f"Generating personalized digest for {subscriber['email']} with preferences: {preferences}")
+
+    html_part = digests.get(preferences)
+    subject = f"Your Weekly RAG Digest - Top {len(preferences) if preferences else 'Relevant'} Research Papers"
+    return subject, html_part
+
+def deliver_digest(digests: DigestCache, subscriber: Dict, smtp_pool: SMTPPool, rate_limiter: RateLimiter) -> bool:
+    """
+    Renders and sends one subscriber's digest on a pooled SMTP connection,
+    retrying once on a fresh connection if the server dropped it.
+    """
+    subject, html_part = render_digest(digests, subscriber)
+    recipient_email = subscriber['email']
+
+    for attempt in range(2):
+        try:
+            with smtp_pool.acquire() as server:
+                if server is not None:
+                    rate_limiter.wait()
+                return send_digest_email(server, recipient_email, subject, html_part)
+        except smtplib.SMTPServerDisconnected:
+            if attempt:
+                raise
+            logger.warning(f"SMTP connection dropped, reconnecting to resend to {recipient_email}")
+
 def generate_and_send_digests():
     """
     Main function to run the weekly digest delivery process.
     """
     logger.info("--- Starting Weekly Digest Delivery Process ---")
+
+    try:
+        from digest_generator import EmailDigestBot
+    except ImportError as e:
+        logger.error(f"Error importing digest_generator: {e}. Make sure digest_generator.py is in the same directory.")
+        raise
     
     db = DatabaseManager()
     digest_bot = EmailDigestBot(db)
@@ -82,27 +254,27 @@ def generate_and_send_digests():
         
     logger.info(f"Found {len(subscribers)} active subscribers.")
     
-    for subscriber in subscribers:
-        recipient_email = subscriber['email']
-        preferences = subscriber['preferences']
-        
-        logger.info(f"Generating personalized digest for {recipient_email} with preferences: {preferences}")
-        
-        # 1. Generate the personalized HTML content
-        html_content = digest_bot.generate_digest_html(preferences)
-        
-        # 2. Define the subject line
-        subject = f"Your Weekly RAG Digest - Top {len(preferences) if preferences else 'Relevant'} Research Papers"
-        
-        # 3. Send the email
-        if send_digest_email(recipient_email, subject, html_content):
-            total_sent += 1
-            
-        # IMPORTANT: Add a small delay to avoid hitting email provider rate limits
-        time.sleep(1) 
-        
+    digests = DigestCache(digest_bot)
+    rate_limiter = RateLimiter(MAX_EMAILS_PER_MINUTE)
+    # Never open more SMTP sessions (or threads) than there are recipients
+    workers = min(DELIVERY_WORKERS, len(subscribers))
+    try:
+        with SMTPPool(workers) as smtp_pool, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(deliver_digest, digests, sub, smtp_pool, rate_limiter): sub['email']
+                for sub in subscribers
+            }
+            for future in as_completed(futures):
+                try:
+                    if future.result():
+                        total_sent += 1
+                except Exception as e:
+                    logger.error(f"Failed to deliver digest to {futures[future]}: {e}")
+    finally:
+        db.close()
+
     logger.info(f"--- Digest delivery complete. Sent {total_sent} of {len(subscribers)} emails. ---")
-    db.close()
 
 if __name__ == "__main__":
     generate_and_send_digests()
\ No newline at end of file
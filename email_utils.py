@@ -1,11 +1,22 @@
 # email_utils.py
 
+import html
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import List, Dict
 import streamlit as st  # to read st.secrets
 
+# Built once at import; only the per-paper fields are filled in per send
+PAPER_HTML = "<p><b>{index}. {title}</b><br><a href='{url}'>{url}</a></p>"
+EMAIL_HTML = (
+    "<html><body>"
+    "<p>Here are your papers:</p>"
+    "{papers}"
+    "<p>– RAG Chatbot</p>"
+    "</body></html>"
+)
+
 def send_email_with_papers(recipient_email: str, papers: List[Dict]) -> None:
     """
     Sends an email listing the given papers (title + link).
@@ -19,21 +30,18 @@ def send_email_with_papers(recipient_email: str, papers: List[Dict]) -> None:
     sender_email = email_conf["SENDER_EMAIL"]
 
     subject = "Top research papers from RAG chatbot"
-    # Build a simple HTML list of papers
+    # Build a simple HTML list of papers (titles come from arXiv, so escape them)
     lines = []
     for i, p in enumerate(papers, start=1):
         arxiv_id = p.get("arxiv_id", "")
-        title = p.get("title", "Untitled")
         url = f"https://arxiv.org/abs/{arxiv_id}" if arxiv_id else "#"
-        lines.append(f"<p><b>{i}. {title}</b><br><a href='{url}'>{url}</a></p>")
+        lines.append(PAPER_HTML.format(
+            index=i,
+            title=html.escape(p.get("title", "Untitled")),
+            url=html.escape(url),
+        ))
 
-    html_body = (
-        "<html><body>"
-        "<p>Here are your papers:</p>"
-        + "".join(lines) +
-        "<p>– RAG Chatbot</p>"
-        "</body></html>"
-    )
+    html_body = EMAIL_HTML.format(papers="".join(lines))
 
     msg = MIMEMultipart("alternative")
     msg["Subject"] = subject
@@ -44,4 +52,4 @@ def send_email_with_papers(recipient_email: str, papers: List[Dict]) -> None:
     with smtplib.SMTP(smtp_server, smtp_port) as server:
         server.starttls()
         server.login(smtp_user, smtp_password)
-        server.sendmail(sender_email, [recipient_email], msg.as_string())
+        server.sendmail(sender_email, [recipient_email], msg.as_bytes())
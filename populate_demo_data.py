@@ -32,9 +32,9 @@ demo_papers = [
 
 def main():
     db = DatabaseManager()
-    for paper in demo_papers:
-        ok = db.insert_paper(paper)
-        print(f"Inserted {paper['arxiv_id']}: {ok}")
+    # One transaction for the whole batch instead of a commit per paper
+    ok = db.insert_papers(demo_papers)
+    print(f"Inserted {len(demo_papers)} demo papers: {ok}")
     db.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from database_manager import DatabaseManager
+
+
+class SearchPapersTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, "test.db"))
+        self.db.insert_papers([
+            {"arxiv_id": "p1", "title": "Crohn's disease progression", "abstract": "Gut inflammation."},
+            {"arxiv_id": "p2", "title": "Deep learning in cardiology", "abstract": "The role of AI for hearts."},
+            {"arxiv_id": "p3", "title": "Sepsis prediction", "abstract": "Early warning scores in the ICU."},
+            {"arxiv_id": "p4", "title": "Skin lesion segmentation", "abstract": "Semantic models for dermatology."},
+        ])
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def ids(self, query):
+        return [p["arxiv_id"] for p in self.db.search_papers(query)]
+
+    def test_apostrophe_fragment_does_not_match_everything(self):
+        self.assertEqual(self.ids("Crohn's disease"), ["p1"])
+
+    def test_stop_words_are_and_ed_not_or_ed(self):
+        self.assertEqual(self.ids("role of AI in cardiology"), ["p2"])
+
+    def test_prefix_match_on_longer_terms(self):
+        self.assertEqual(self.ids("cardio"), ["p2"])
+
+    def test_title_edit_is_reindexed(self):
+        self.db.cursor.execute("UPDATE papers SET processed = 1 WHERE arxiv_id = 'p3'")
+        self.db.cursor.execute("UPDATE papers SET title = 'Septic shock' WHERE arxiv_id = 'p3'")
+        self.db.conn.commit()
+        self.assertEqual(self.ids("shock"), ["p3"])
+        self.assertEqual(self.ids("sepsis"), [])
+
+    def test_search_still_correct_after_vacuum(self):
+        self.db.cursor.execute("DELETE FROM papers WHERE arxiv_id IN ('p1', 'p2')")
+        self.db.conn.commit()
+        self.db.vacuum()
+        # rank=1 also checks the index against the papers content table, so a
+        # stale rowid mapping raises here
+        self.db.conn.execute("INSERT INTO papers_fts(papers_fts, rank) VALUES('integrity-check', 1)")
+        self.assertEqual(self.ids("sepsis"), ["p3"])
+        self.assertEqual(self.ids("dermatology"), ["p4"])
+
+    def test_query_without_terms_returns_nothing(self):
+        self.assertEqual(self.ids("?!"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
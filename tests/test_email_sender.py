@@ -0,0 +1,109 @@
+import smtplib
+import threading
+import time
+import unittest
+from unittest import mock
+
+import email_sender
+from email_sender import DigestCache, RateLimiter, SMTPPool, deliver_digest
+
+
+class StubDigestBot:
+    def __init__(self, fail_for=()):
+        self.fail_for = set(fail_for)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_digest_html(self, preferences):
+        with self._lock:
+            self.calls.append(tuple(preferences))
+        time.sleep(0.01)  # keep renders overlapping across threads
+        if set(preferences) & self.fail_for:
+            raise RuntimeError("render failed")
+        return f"<p>{', '.join(preferences)}</p>"
+
+
+class StubSMTP:
+    """Logged-in connection stub; drops on its first send when told to."""
+
+    def __init__(self, drop_first_send=False):
+        self.drop_first_send = drop_first_send
+        self.sent = []
+        self.closed = False
+
+    def sendmail(self, sender, recipients, message):
+        if self.drop_first_send:
+            self.drop_first_send = False
+            raise smtplib.SMTPServerDisconnected("dropped")
+        self.sent.extend(recipients)
+
+    def quit(self):
+        self.closed = True
+
+
+class DigestCacheTest(unittest.TestCase):
+    def test_identical_preferences_render_once(self):
+        bot = StubDigestBot()
+        digests = DigestCache(bot)
+        parts = []
+        threads = [
+            threading.Thread(target=lambda: parts.append(digests.get(["rag", "llm"])))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(bot.calls, [("rag", "llm")])
+        self.assertEqual(len({id(p) for p in parts}), 1)
+
+    def test_render_failure_only_affects_its_own_preferences(self):
+        bot = StubDigestBot(fail_for={"broken"})
+        digests = DigestCache(bot)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                digests.get(["broken"])
+        self.assertIn("rag", digests.get(["rag"]).get_payload(decode=True).decode())
+        # The failure is cached too, not re-rendered per subscriber
+        self.assertEqual(bot.calls.count(("broken",)), 1)
+
+
+class DeliverDigestTest(unittest.TestCase):
+    subscriber = {"email": "reader@example.com", "preferences": ["rag"]}
+
+    def test_disconnect_resends_once_on_fresh_connection(self):
+        opened = [StubSMTP(drop_first_send=True), StubSMTP()]
+        with mock.patch.object(email_sender, "open_smtp_connection", side_effect=opened):
+            with SMTPPool(1) as smtp_pool:
+                sent = deliver_digest(DigestCache(StubDigestBot()), self.subscriber,
+                                      smtp_pool, RateLimiter(100))
+        self.assertTrue(sent)
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(opened[0].sent, [])
+        self.assertEqual(opened[1].sent, ["reader@example.com"])
+
+    def test_failed_reconnect_is_retried_on_next_acquire(self):
+        dropped, fresh = StubSMTP(drop_first_send=True), StubSMTP()
+        opens = [dropped, OSError("network down"), fresh]
+        with mock.patch.object(email_sender, "open_smtp_connection", side_effect=opens):
+            with SMTPPool(1) as smtp_pool:
+                with self.assertRaises(OSError):
+                    deliver_digest(DigestCache(StubDigestBot()), self.subscriber,
+                                   smtp_pool, RateLimiter(100))
+                with smtp_pool.acquire() as server:
+                    self.assertIs(server, fresh)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_call_over_the_limit_waits_for_the_window(self):
+        limiter = RateLimiter(max_calls=3, period=0.3)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.wait()
+        self.assertLess(time.monotonic() - start, 0.1)
+        limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()